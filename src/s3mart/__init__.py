@@ -32,8 +32,7 @@ cache = Cache(dirname = __name__)
 cache.create()
 
 settings = Settings(location = PATH["CACHE"], defaults = {
-    "jobs":                     DEFAULT["jobs"],
-    "trim_chunks":              DEFAULT["trim_chunks"],
+    "fasterq_tmp":              DEFAULT["fasterq_tmp"],
     "primer_difference":        DEFAULT["primer_difference"],
     "quality_average":          DEFAULT["quality_average"],
     "maximum_ambiguity":        DEFAULT["maximum_ambiguity"],
@@ -5,6 +5,8 @@ from s3mart import __name__ as NAME
 
 _PREFIX = NAME.upper()
 
+JOBS    = int(getenv("JOBS", CPU_COUNT, prefix = _PREFIX))
+
 CONST = {
     "prefix": _PREFIX,
 
@@ -13,8 +15,7 @@ CONST = {
 }
 
 DEFAULT = {
-    "jobs":                     getenv("JOBS", CPU_COUNT, prefix = _PREFIX),
-    "trim_chunks":              8,
+    "fasterq_tmp":              getenv("FASTERQ_TMP", "/dev/shm/%s" % NAME, prefix = _PREFIX),
     "primer_difference":        5,
     "quality_average":          35,
     "maximum_ambiguity":        0,
@@ -1,5 +1,6 @@
 import os.path as osp
 import json
+import itertools
 
 import tqdm as tq
 
@@ -9,16 +10,15 @@ from s3mart import settings, __name__ as NAME
 from bpyutils.util._dict   import autodict
 from bpyutils.util._csv    import read as read_csv
 from bpyutils.util.array   import group_by
-from bpyutils.util.ml      import get_data_dir
-from bpyutils.util.types   import build_fn
 from bpyutils.util.string  import check_url, safe_decode
 from bpyutils.util.system  import write, read, makedirs, get_files, remove
-from bpyutils import parallel, log, request as req
+from bpyutils import log, request as req
 from bpyutils._compat import iteritems, itervalues
 
 from s3mart.data.functions import (
     get_input_data,
     get_fastq,
+    get_fastqs,
     check_quality,
     trim_seqs,
     merge_seqs,
@@ -26,28 +26,16 @@ from s3mart.data.functions import (
     build_plots,
     patch_tree_file,
 )
-from s3mart.data.util  import install_silva
+from s3mart.data.util  import install_silva, resolve_data_dir
 
 logger = log.get_logger(name = NAME)
 
 CACHE  = PATH["CACHE"]
 
-def get_fastq_group(group, data_dir = None, *args, **kwargs):
-    jobs = kwargs.get("jobs", settings.get("jobs"))
-    fastqc = kwargs.pop("fastqc", True)
-
-    with parallel.no_daemon_pool(processes = jobs) as pool:
-        length = len(group)
-
-        function = build_fn(get_fastq, data_dir = data_dir, fastqc = fastqc, *args, **kwargs)
-        results  = pool.imap(function, group)
-
-        list(tq.tqdm(results, total = length))
-
 def check_data(input = None, data_dir = None, *args, **kwargs):
     data_dir, groups = get_input_data(input = input, data_dir = data_dir, *args, **kwargs)
 
-    data_dir = get_data_dir(NAME, data_dir)
+    data_dir = resolve_data_dir(NAME, data_dir)
 
     logger.info("Checking data integrity...")
 
@@ -96,20 +84,18 @@ def check_data(input = None, data_dir = None, *args, **kwargs):
 def get_data(input = None, data_dir = None, *args, **kwargs):
     data_dir, groups = get_input_data(input = input, data_dir = data_dir, *args, **kwargs)
 
-    data_dir = get_data_dir(NAME, data_dir)
-    jobs     = kwargs.get("jobs", settings.get("jobs"))
+    data_dir = resolve_data_dir(NAME, data_dir)
 
     logger.info("Data directory at %s." % data_dir)
 
     if groups:
         logger.info("Fetching FASTQ files...")
-        with parallel.no_daemon_pool(processes = jobs) as pool:
-            function = build_fn(get_fastq_group, data_dir = data_dir, *args, **kwargs)
-            list(pool.imap(function, itervalues(groups)))
+        data = list(itertools.chain.from_iterable(itervalues(groups)))
+        get_fastqs(data, data_dir = data_dir, *args, **kwargs)
 
 def preprocess_data(input = None, data_dir = None, *args, **kwargs):
     data_dir, data = get_input_data(input = input, data_dir = data_dir, *args, **kwargs)
-    data_dir = get_data_dir(NAME, data_dir)
+    data_dir = resolve_data_dir(NAME, data_dir)
 
     minimal_output = kwargs.get("minimal_output", settings.get("minimal_output"))
 
@@ -1,5 +1,5 @@
 from s3mart.data.functions.get_input_data  import get_input_data
-from s3mart.data.functions.get_fastq       import get_fastq
+from s3mart.data.functions.get_fastq       import get_fastq, get_fastqs
 from s3mart.data.functions.check_quality   import check_quality
 from s3mart.data.functions.trim_seqs       import trim_seqs
 from s3mart.data.functions.merge_seqs      import merge_seqs
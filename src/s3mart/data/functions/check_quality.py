@@ -1,8 +1,9 @@
 import os, os.path as osp
 
 from s3mart import settings, __name__ as NAME
+from s3mart.const import JOBS
+from s3mart.data.util import resolve_data_dir
 
-from bpyutils.util.ml      import get_data_dir
 from bpyutils.util.system  import (
     ShellEnvironment, popen,
     makedirs,
@@ -15,7 +16,7 @@ logger = log.get_logger(name = NAME)
 
 def fastqc_check(file_, output_dir = None, threads = None):
     output_dir = output_dir or os.cwd()
-    threads    = threads or settings.get("jobs")
+    threads    = threads or JOBS
 
     basename   = osp.basename(file_)
     prefix, _  = osp.splitext(basename)
@@ -28,8 +29,8 @@ def fastqc_check(file_, output_dir = None, threads = None):
         logger.warn("FASTQC for file %s already exists." % file_)
 
 def check_quality(data_dir = None, multiqc = False, **kwargs):    
-    data_dir = get_data_dir(NAME, data_dir)
-    # jobs     = kwargs.get("jobs", settings.get("jobs"))
+    data_dir = resolve_data_dir(NAME, data_dir)
+    # jobs     = kwargs.get("jobs", JOBS)
 
     minimal_output = kwargs.get("minimal_output", settings.get("minimal_output"))
     
@@ -1,69 +1,212 @@
 import os.path as osp
+import hashlib
+import shlex
+import shutil
+import threading
+import multiprocessing as mp
+from queue import Queue, Full
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import tqdm as tq
+
 from s3mart import settings, __name__ as NAME
+from s3mart.const import JOBS
 
 from s3mart.data.functions.check_quality import fastqc_check
+from s3mart.data.util import resolve_data_dir
 
-from bpyutils.util.ml      import get_data_dir
-from bpyutils.util.types   import build_fn
+from bpyutils.util.types   import lmap, build_fn
 from bpyutils.util.system  import (
     ShellEnvironment,
     get_files,
     makedirs,
+    read, write,
     remove
 )
 from bpyutils import log, parallel
 
 logger = log.get_logger(name = NAME)
 
-def get_fastq(meta, data_dir = None, *args, **kwargs):
-    sra, layout = meta["sra"], meta["layout"]
+# fasterq-dump does not scale beyond 6 threads, more only exhausts IO.
+_FASTERQ_DUMP_MAX_THREADS = 6
 
-    jobs = kwargs.get("jobs", settings.get("jobs"))
-    data_dir = get_data_dir(NAME, data_dir)
+# fasterq-dump memory (in MB), shared between concurrent dumps.
+_FASTERQ_DUMP_TOTAL_MEM   = 40 * 1024
+_FASTERQ_DUMP_MAX_MEM     = 8  * 1024
+_FASTERQ_DUMP_BUFSIZE     = "100MB"
+_FASTERQ_DUMP_CURCACHE    = "500MB"
 
-    minimal_output = kwargs.get("minimal_output", settings.get("minimal_output"))
-    
-    fastqc = kwargs.get("fastqc", True)
+_PREFETCH_MAX_WORKERS     = 8
+_QUEUE_TIMEOUT            = 1
 
-    fastqc_dir = osp.join(data_dir, "fastqc")
-    makedirs(fastqc_dir, exist_ok = True)
+# only the head of an .sra is hashed, as a fingerprint for its validation.
+_SRA_FINGERPRINT_SIZE     = 1 << 20
 
-    with ShellEnvironment(cwd = data_dir) as shell:
-        sra_dir = osp.join(data_dir, sra)
+# Estimated ratio of the uncompressed FASTQ output to the size of its .sra.
+_FASTQ_SRA_SIZE_RATIO     = 4
+
+def _get_path_sra(sra, data_dir):
+    sra_dir  = osp.join(data_dir, sra)
+    path_sra = osp.join(sra_dir, sra, "%s.sra" % sra)
+
+    return sra_dir, path_sra
+
+def _get_fasterq_fallback_dir(sra_dir):
+    return makedirs(osp.join(sra_dir, "fasterq.tmp"), exist_ok = True)
+
+def _get_fasterq_tmp_dir(sra, path_sra, sra_dir, **kwargs):
+    """
+    Get a temporary directory for fasterq-dump, preferably on a tmpfs.
+
+    Falls back to a directory within the SRA directory if the temporary
+    directory cannot be created or if its share of free space (split across
+    concurrent dumps) is less than twice the expected output size.
+
+    Returns the directory and whether it is the fallback.
+    """
+    jobs     = kwargs.get("jobs", JOBS)
+    tmp_root = kwargs.get("fasterq_tmp", settings.get("fasterq_tmp"))
+
+    if tmp_root:
+        try:
+            tmp_dir  = makedirs(osp.join(tmp_root, sra), exist_ok = True)
+
+            expected = _FASTQ_SRA_SIZE_RATIO * osp.getsize(path_sra) \
+                if osp.exists(path_sra) else 0
+
+            if shutil.disk_usage(tmp_dir).free // jobs >= 2 * expected:
+                return tmp_dir, False
+
+            logger.warn("Insufficient space at %s for SRA %s." % (tmp_root, sra))
+            remove(tmp_dir, recursive = True)
+        except OSError as e:
+            logger.warn("Unable to use %s as temporary directory. Error: %s" % (tmp_root, e))
+
+    return _get_fasterq_fallback_dir(sra_dir), True
 
+def _get_sra_fingerprint(path_sra):
+    with open(path_sra, "rb") as f:
+        return hashlib.sha256(f.read(_SRA_FINGERPRINT_SIZE)).hexdigest()
+
+def _check_sra_validated(path_sra):
+    path_validated = "%s.validated" % path_sra
+
+    return osp.exists(path_validated) and \
+        read(path_validated) == _get_sra_fingerprint(path_sra)
+
+def _mark_sra_validated(path_sra):
+    write("%s.validated" % path_sra, _get_sra_fingerprint(path_sra), force = True)
+
+def _validate_sra(sra, path_sra, shell):
+    logger.info("Validating SRA %s..." % sra)
+    logger.info("Performing vdb-validate for SRA %s at %s." % (sra, path_sra))
+    code = shell("vdb-validate {path}".format(path = path_sra))
+
+    if not code:
+        _mark_sra_validated(path_sra)
+        logger.success("Successfully validated SRA %s." % sra)
+    else:
+        logger.error("Unable to validate SRA %s." % sra)
+
+    return not code
+
+def _build_fasterq_dump_argv(sra, layout, tmp_dir, jobs):
+    # split the sorting memory budget across concurrent dumps.
+    mem  = min(_FASTERQ_DUMP_TOTAL_MEM // jobs, _FASTERQ_DUMP_MAX_MEM)
+
+    argv = ["fasterq-dump",
+        "--threads", str(_FASTERQ_DUMP_MAX_THREADS),
+        "--skip-technical",
+        "--temp", tmp_dir,
+        "--mem", "%dMB" % mem,
+        "--bufsize", _FASTERQ_DUMP_BUFSIZE,
+        "--curcache", _FASTERQ_DUMP_CURCACHE
+    ]
+
+    if layout == "paired":
+        argv.append("--split-files")
+
+    argv.append(sra)
+
+    return argv
+
+def _fasterq_dump(shell, sra, layout, sra_dir, tmp_dir, jobs, raise_err = True):
+    argv = _build_fasterq_dump_argv(sra, layout, tmp_dir, jobs)
+
+    try:
+        return shell(*lmap(shlex.quote, argv), cwd = sra_dir, raise_err = raise_err)
+    finally:
+        remove(tmp_dir, recursive = True, raise_err = False)
+
+def _prefetch_one(meta, data_dir = None, *args, **kwargs):
+    sra = meta["sra"]
+
+    data_dir = resolve_data_dir(NAME, data_dir)
+    sra_dir, path_sra = _get_path_sra(sra, data_dir)
+
+    force_validate = kwargs.get("force_validate", False)
+
+    with ShellEnvironment(cwd = data_dir) as shell:
         logger.info("Checking if SRA %s is prefetched..." % sra)
-        path_sra = osp.join(sra_dir, sra, "%s.sra" % sra)
 
         if not osp.exists(path_sra):
-            logger.info("Performing prefetch for SRA %s in directory %s." % (sra, sra_dir))
-            code = shell("prefetch -O {output_dir} {sra}".format(output_dir = sra_dir, sra = sra))
+            # prefetch and validate in a single shell invocation, a freshly
+            # fetched SRA is always validated.
+            logger.info("Performing prefetch and vdb-validate for SRA %s in directory %s." % (sra, sra_dir))
+            code = shell("prefetch -O {output_dir} {sra} && vdb-validate {path}".format(
+                output_dir = sra_dir, sra = sra, path = path_sra))
 
             if not code:
-                logger.success("Successfully prefeteched SRA %s." % sra)
-
-                logger.info("Validating SRA %s..." % sra)
-                logger.info("Performing vdb-validate for SRA %s in directory %s." % (sra, sra_dir))
-                code = shell("vdb-validate {dir}".format(dir = osp.join(sra_dir, sra)))
-
-                if not code:
-                    logger.success("Successfully validated SRA %s." % sra)
-                else:
-                    logger.error("Unable to validate SRA %s." % sra)
-                    return
+                _mark_sra_validated(path_sra)
+                logger.success("Successfully prefeteched and validated SRA %s." % sra)
             else:
-                logger.error("Unable to prefetech SRA %s." % sra)
+                logger.error("Unable to prefetech and validate SRA %s." % sra)
                 return
         else:
             logger.warn("SRA %s already prefeteched." % sra)
 
+            if not force_validate and _check_sra_validated(path_sra):
+                logger.warn("SRA %s already validated." % sra)
+            elif not _validate_sra(sra, path_sra, shell):
+                return
+
+    return meta
+
+def _dump_one(meta, data_dir = None, *args, **kwargs):
+    sra, layout = meta["sra"], meta["layout"]
+
+    jobs = kwargs.get("jobs", JOBS)
+    data_dir = resolve_data_dir(NAME, data_dir)
+
+    minimal_output = kwargs.get("minimal_output", settings.get("minimal_output"))
+
+    fastqc = kwargs.get("fastqc", True)
+
+    fastqc_dir = osp.join(data_dir, "fastqc")
+    makedirs(fastqc_dir, exist_ok = True)
+
+    sra_dir, path_sra = _get_path_sra(sra, data_dir)
+
+    with ShellEnvironment(cwd = data_dir) as shell:
         logger.info("Checking if FASTQ files for SRA %s has been downloaded..." % sra)
         fastq_files = get_files(sra_dir, "*.fastq")
-        
+
         if not fastq_files:
             logger.info("Downloading FASTQ file(s) for SRA %s..." % sra)
-            args = "--split-files" if layout == "paired" else "" 
-            code = shell("fasterq-dump --threads {threads} {args} {sra}".format(
-                threads = jobs, args = args, sra = sra), cwd = sra_dir)
+            tmp_dir, fallback = _get_fasterq_tmp_dir(sra, path_sra, sra_dir, **kwargs)
+            logger.info("Using temporary directory %s for SRA %s." % (tmp_dir, sra))
+
+            # the tmpfs may still fill up (e.g. a shared /dev/shm), in which
+            # case the dump is retried once within the SRA directory.
+            code = _fasterq_dump(shell, sra, layout, sra_dir, tmp_dir, jobs,
+                raise_err = fallback)
+
+            if code and not fallback:
+                logger.warn("Unable to download FASTQ file(s) for SRA %s using %s. Retrying..." % (sra, tmp_dir))
+                remove(*get_files(sra_dir, "*.fastq"), raise_err = False)
+
+                tmp_dir = _get_fasterq_fallback_dir(sra_dir)
+                code = _fasterq_dump(shell, sra, layout, sra_dir, tmp_dir, jobs)
 
             if not code:
                 logger.success("Successfully downloaded FASTQ file(s) for SRA %s." % sra)
@@ -79,9 +222,87 @@ def get_fastq(meta, data_dir = None, *args, **kwargs):
 
             with parallel.pool(processes = jobs) as pool:
                 function_ = build_fn(fastqc_check, output_dir = fastqc_dir, threads = jobs)
-                list(pool.imap(function_, fastq_files))
+                for _ in pool.imap_unordered(function_, fastq_files):
+                    pass
         else:
             logger.warn("Skipping FASTQC quality check.")
 
         if minimal_output:
-            remove(path_sra)
\ No newline at end of file
+            remove(path_sra, "%s.validated" % path_sra, raise_err = False)
+
+    return sra
+
+def get_fastq(meta, data_dir = None, *args, **kwargs):
+    if _prefetch_one(meta, data_dir = data_dir, *args, **kwargs):
+        _dump_one(meta, data_dir = data_dir, *args, **kwargs)
+
+def get_fastqs(data, data_dir = None, *args, **kwargs):
+    """
+    Fetch FASTQ files for a list of SRAs. Prefetch (network bound) and
+    fasterq-dump (IO/CPU bound) run as two stages connected by a bounded
+    queue, so that dumps proceed while the next SRAs are being prefetched.
+    """
+    jobs = kwargs.get("jobs", JOBS)
+
+    length   = len(data)
+    queue    = Queue(maxsize = 2 * jobs)
+    slots    = threading.BoundedSemaphore(jobs)
+
+    prefetch = build_fn(_prefetch_one, data_dir = data_dir, *args, **kwargs)
+    dump     = build_fn(_dump_one,     data_dir = data_dir, *args, **kwargs)
+
+    # set on failure so that prefetchers stop and never block on a full
+    # queue that is no longer drained.
+    stop     = threading.Event()
+
+    def prefetch_and_enqueue(meta):
+        result = None
+
+        try:
+            if not stop.is_set():
+                result = prefetch(meta)
+        except Exception as e:
+            logger.error("Unable to prefetch SRA %s. Error: %s" % (meta["sra"], e))
+
+        while not stop.is_set():
+            try:
+                queue.put(result, timeout = _QUEUE_TIMEOUT)
+                break
+            except Full:
+                pass
+
+    # dump workers are spawned, not forked, since forking while prefetch
+    # threads hold locks (e.g. logging) can deadlock the child.
+    mp_context = mp.get_context("spawn")
+
+    with tq.tqdm(total = length) as progress, \
+        ThreadPoolExecutor(max_workers = min(jobs, _PREFETCH_MAX_WORKERS)) as prefetchers, \
+        ProcessPoolExecutor(max_workers = jobs, mp_context = mp_context) as dumpers:
+
+        futures = [prefetchers.submit(prefetch_and_enqueue, meta) for meta in data]
+
+        def on_dump_done(future):
+            slots.release()
+            progress.update()
+
+            if future.exception():
+                logger.error("Unable to download FASTQ file(s): %s" % future.exception())
+
+        try:
+            for _ in range(length):
+                slots.acquire()
+                meta = queue.get()
+
+                if meta:
+                    future = dumpers.submit(dump, meta)
+                    future.add_done_callback(on_dump_done)
+                else:
+                    slots.release()
+                    progress.update()
+        except BaseException:
+            stop.set()
+
+            for future in futures:
+                future.cancel()
+
+            raise
@@ -1,21 +1,92 @@
-import os.path as osp
+import os, os.path as osp
+import csv
+import functools
 
 from s3mart.config  import PATH
 from s3mart import __name__ as NAME
+from s3mart.data.util import resolve_data_dir
 
-from bpyutils.util._csv    import read as read_csv
 from bpyutils.util.array   import group_by
-from bpyutils.util.ml      import get_data_dir
 from bpyutils.util.string  import check_url, safe_decode
 from bpyutils.util.system  import write
+from bpyutils.util.types   import auto_typecast
 from bpyutils import log, request as req
 
 logger = log.get_logger(name = NAME)
 
 CACHE  = PATH["CACHE"]
 
+_TYPECAST_BOOL = { "True": True, "False": False, "None": None }
+
+def _get_typecaster(value):
+    """
+    Get a fast typecaster for a column, given its first non-empty value.
+
+    Only typecasters whose success implies the same result as ``auto_typecast``
+    are returned, ``None`` otherwise (i.e. typecast every cell).
+    """
+    if value in _TYPECAST_BOOL:
+        return _TYPECAST_BOOL.__getitem__
+
+    try:
+        int(value)
+        return int
+    except ValueError:
+        pass
+
+    # a float or string column may still hold cells that auto_typecast would
+    # cast to an int (e.g. "2.5" followed by "3"), so never shortcut them.
+    return None
+
+def _typecast(typecaster, value):
+    if typecaster is None or value == "":
+        return auto_typecast(value)
+
+    try:
+        return typecaster(value)
+    except (KeyError, ValueError, TypeError):
+        return auto_typecast(value)
+
+@functools.lru_cache(maxsize = 8)
+def _read_csv(path, mtime):
+    """
+    Read and typecast rows of a CSV file. The typecaster for each column is
+    detected once (on its first non-empty value) instead of on every cell,
+    yielding the same values as ``auto_typecast`` on every cell.
+
+    Results are cached on (path, mtime) so that a modified file is re-read.
+    """
+    rows = []
+
+    with open(path) as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        typecasters = {}
+
+        for row in reader:
+            # pair cells with the header as dict_from_list does, i.e. short
+            # rows lack trailing columns and extra cells are dropped.
+            row = tuple(zip(header, row))
+
+            for column, value in row:
+                if column not in typecasters and value != "":
+                    typecasters[column] = _get_typecaster(value)
+
+            rows.append(tuple(
+                (column, _typecast(typecasters.get(column), value))
+                    for column, value in row
+            ))
+
+    return tuple(rows)
+
+def _read_csv_rows(path):
+    mtime = os.stat(path).st_mtime
+
+    for row in _read_csv(path, mtime):
+        yield dict(row)
+
 def get_input_data(input = None, data_dir = None, *args, **kwargs):
-    data_dir = get_data_dir(NAME, data_dir)
+    data_dir = resolve_data_dir(NAME, data_dir)
 
     if input:
         if check_url(input, raise_err = False):
@@ -37,7 +108,6 @@ def get_input_data(input = None, data_dir = None, *args, **kwargs):
     groups = {}
 
     if osp.isfile(input):
-        data   = read_csv(input)
-        groups = group_by(data, "group")
+        groups = group_by(_read_csv_rows(input), "group")
 
     return data_dir, groups
\ No newline at end of file
@@ -1,9 +1,8 @@
-import os.path as osp
+import os, os.path as osp
 
 from s3mart.config  import PATH
 from s3mart import __name__ as NAME
 
-from bpyutils.util.ml      import get_data_dir
 from bpyutils.util.system  import (
     ShellEnvironment,
     make_temp_dir, get_files, move,
@@ -12,7 +11,7 @@ from bpyutils.util.system  import (
 from bpyutils import log
 
 from s3mart.data.functions.trim_seqs import _FILENAME_TRIMMED, _DATA_DIR_NAME_TRIMMED
-from s3mart.data.util import build_mothur_script
+from s3mart.data.util import build_mothur_script, resolve_data_dir
 from s3mart import settings
 
 logger = log.get_logger(name = NAME)
@@ -24,7 +23,7 @@ def merge_seqs(data_dir = None, force = False, **kwargs):
 
     success  = False
 
-    data_dir = get_data_dir(NAME, data_dir = data_dir)
+    data_dir = resolve_data_dir(NAME, data_dir)
 
     logger.info("Finding files in directory: %s" % data_dir)
     
@@ -37,7 +36,15 @@ def merge_seqs(data_dir = None, force = False, **kwargs):
         output_fasta = osp.join(data_dir, "merged.fasta")
         output_group = osp.join(data_dir, "merged.group")
 
-        if not any(osp.exists(f) for f in (output_fasta, output_group)) or force:
+        outputs = (output_fasta, output_group)
+
+        if not any(osp.exists(f) for f in outputs) or force:
+            # mothur writes to partial outputs that replace the existing ones
+            # only on success, so a failed forced merge keeps previous outputs.
+            # Partials left behind by a failed merge are removed here.
+            partials = ["%s.partial" % output for output in outputs]
+            remove(*partials, raise_err = False)
+
             with make_temp_dir(root_dir = CACHE) as tmp_dir:
                 mothur_file = osp.join(tmp_dir, "script")
                 build_mothur_script(
@@ -45,20 +52,23 @@ def merge_seqs(data_dir = None, force = False, **kwargs):
                     output       = mothur_file,
                     input_fastas = trimmed,
                     input_groups = groups,
-                    output_fasta = output_fasta,
-                    output_group = output_group
+                    output_fasta = partials[0],
+                    output_group = partials[1]
                 )
 
                 with ShellEnvironment(cwd = tmp_dir) as shell:
                     code = shell("mothur %s" % mothur_file)
 
                     if not code:
-                        # HACK: weird hack around failure of mothur detecting output for merge.files
-                        merged_fasta = get_files(data_dir, "merged.fasta")
-                        merged_group = get_files(data_dir, "merged.group")
-
-                        move(*merged_fasta, dest = output_fasta)
-                        move(*merged_group, dest = output_group)
+                        for partial, output in zip(partials, outputs):
+                            # merge.files writes to the path given in the script. Only
+                            # scan for it if mothur failed to write it there.
+                            if not osp.exists(partial):
+                                # HACK: weird hack around failure of mothur detecting output for merge.files
+                                merged = get_files(data_dir, osp.basename(partial))
+                                move(*merged, dest = partial)
+
+                            os.replace(partial, output)
 
                         logger.success("Successfully merged.")
 
@@ -2,24 +2,24 @@ import os.path as osp
 
 from s3mart.config  import PATH
 from s3mart import settings, __name__ as NAME
+from s3mart.const  import JOBS
 
 from bpyutils.util.array   import sequencify
-from bpyutils.util.ml      import get_data_dir
 from bpyutils.util.system  import (
     ShellEnvironment, makedirs,
     make_temp_dir, copy, move
 )
 from bpyutils import log
 
-from s3mart.data.util import build_mothur_script
+from s3mart.data.util import build_mothur_script, resolve_data_dir
 
 logger = log.get_logger(name = NAME)
 
 CACHE  = PATH["CACHE"]
 
 def preprocess_seqs(data_dir = None, **kwargs):
-    data_dir = get_data_dir(NAME, data_dir)
-    jobs     = kwargs.get("jobs", settings.get("jobs"))
+    data_dir = resolve_data_dir(NAME, data_dir)
+    jobs     = kwargs.get("jobs", JOBS)
 
     merged_fasta = osp.join(data_dir, "merged.fasta")
     merged_group = osp.join(data_dir, "merged.group")
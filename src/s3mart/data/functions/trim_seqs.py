@@ -1,27 +1,35 @@
 import os, os.path as osp
+import errno
 import itertools
+import collections
+import shutil
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 import tqdm as tq
 
 from s3mart.config  import PATH
 from s3mart import settings, __name__ as NAME
+from s3mart.const  import JOBS
 
-from bpyutils.util.ml      import get_data_dir
-from bpyutils.util.array   import chunkify, group_by, flatten
-from bpyutils.util._dict   import dict_from_list
-from bpyutils.util.types   import lmap, lfilter, build_fn
+from bpyutils.util.array   import group_by, flatten
+from bpyutils.util.types   import build_fn
 from bpyutils.util.system  import (
     ShellEnvironment,
     makedirs,
-    make_temp_dir, get_files, copy, write,
+    make_temp_dir, get_files, write,
     remove
 )
 from bpyutils.util.string    import get_random_str
 from bpyutils.exception      import PopenError
 from bpyutils._compat import itervalues, iteritems
-from bpyutils import parallel, log
+from bpyutils import log
 
-from s3mart.data.util import build_mothur_script
+from s3mart.data.util import build_mothur_script, resolve_data_dir
 from s3mart.data.functions.get_input_data import get_input_data
 
 logger = log.get_logger(name = NAME)
@@ -31,17 +39,105 @@ CACHE  = PATH["CACHE"]
 _DATA_DIR_NAME_TRIMMED = "trimmed"
 _FILENAME_TRIMMED      = "trimmed"
 
-def _get_fastq_file_line(fname):
-    prefix    = osp.basename(fname)
-    prefix, _ = osp.splitext(prefix)
+# ioctl FICLONE from linux/fs.h, used for reflinks on XFS/Btrfs.
+_FICLONE = 0x40049409
+
+# errors from os.link on which staging falls back to a reflink or copy.
+_LINK_FALLBACK_ERRNOS = (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP)
+
+def _reflink(source, target):
+    if not fcntl:
+        return False
+
+    # "xb" never opens (and truncates) an existing inode, which may well be
+    # a hardlink to the source itself.
+    with open(source, "rb") as fsrc, open(target, "xb") as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+            return True
+        except OSError:
+            pass
+
+    os.remove(target)
+
+    return False
+
+def _stage_files(files, dest):
+    """
+    Stage (read-only) input files into a directory using hardlinks when on
+    the same filesystem, reflinks when supported, else a byte copy.
+
+    Duplicate inputs are staged once. An input whose basename is already
+    staged is skipped, an existing target is never written to.
+    """
+    dest_dev = os.stat(dest).st_dev
+
+    for source in collections.OrderedDict.fromkeys(files):
+        target = osp.join(dest, osp.basename(source))
+
+        if osp.lexists(target):
+            logger.warn("Unable to stage %s, %s already exists." % (source, target))
+            continue
+
+        if os.stat(source).st_dev == dest_dev:
+            try:
+                os.link(source, target)
+                continue
+            except OSError as e:
+                if e.errno not in _LINK_FALLBACK_ERRNOS:
+                    raise
+
+        if not _reflink(source, target):
+            shutil.copy2(source, target)
+
+def _fast_copy(source, target):
+    """
+    Copy a file in-kernel using copy_file_range where available, else fall
+    back to shutil.copyfile (e.g. EXDEV, an unsupported filesystem or a short
+    copy, which copyfile then overwrites).
+    """
+    if hasattr(os, "copy_file_range"):
+        try:
+            with open(source, "rb") as fsrc, open(target, "wb") as fdst:
+                size = os.fstat(fsrc.fileno()).st_size
+
+                while size > 0:
+                    copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), size)
+
+                    if not copied:
+                        break
+
+                    size -= copied
+
+            if not size:
+                return
 
-    return "%s %s" % (prefix, fname)
+            logger.warn("Short copy of %s to %s, falling back to a regular copy." % (source, target))
+        except OSError:
+            pass
+
+    shutil.copyfile(source, target)
+
+_TARGET_TYPES = ("fasta", "group", "summary")
+
+def _get_target_path(target_dir):
+    return { x: osp.join(target_dir, "%s.%s" % (_FILENAME_TRIMMED, x)) for x in _TARGET_TYPES }
+
+def _check_target_path(target_dir):
+    # a single directory read instead of one stat() per target.
+    try:
+        entries = {entry.name for entry in os.scandir(target_dir)}
+    except FileNotFoundError:
+        entries = set()
+
+    return all("%s.%s" % (_FILENAME_TRIMMED, x) in entries for x in _TARGET_TYPES)
 
 def _mothur_trim_files(config, data_dir = None, **kwargs):
     logger.info("Using config %s to filter files." % config)
 
-    jobs       = kwargs.get("jobs", settings.get("jobs"))
-    data_dir   = get_data_dir(NAME, data_dir)
+    jobs       = kwargs.get("jobs", JOBS)
+    processors = kwargs.get("processors", jobs)
+    data_dir   = resolve_data_dir(NAME, data_dir)
 
     files      = config.pop("files")
     target_dir = config.pop("target_dir")
@@ -58,16 +154,12 @@ def _mothur_trim_files(config, data_dir = None, **kwargs):
 
     minimal_output = kwargs.get("minimal_output", settings.get("minimal_output"))
 
-    target_types = ("fasta", "group", "summary")
-    target_path  = dict_from_list(
-        target_types,
-        lmap(lambda x: osp.join(target_dir, "%s.%s" % (_FILENAME_TRIMMED, x)), target_types)
-    )
+    target_path = _get_target_path(target_dir)
 
-    if not all(osp.exists(x) for x in itervalues(target_path)):
+    if not _check_target_path(target_dir):
         with make_temp_dir(root_dir = CACHE) as tmp_dir:
-            logger.info("[group %s] Copying FASTQ files %s for pre-processing at %s." % (group, files, tmp_dir))
-            copy(*files, dest = tmp_dir)
+            logger.info("[group %s] Staging FASTQ files %s for pre-processing at %s." % (group, files, tmp_dir))
+            _stage_files(files, tmp_dir)
 
             prefix = get_random_str()
             logger.info("[group %s] Using prefix for mothur: %s" % (group, prefix))
@@ -76,7 +168,7 @@ def _mothur_trim_files(config, data_dir = None, **kwargs):
 
             if layout == "single":
                 fastq_file = osp.join(tmp_dir, "%s.file" % prefix)
-                fastq_data = "\n".join(lmap(_get_fastq_file_line, files))
+                fastq_data = "\n".join("%s %s" % (osp.basename(f).rsplit(".", 1)[0], f) for f in files)
                 write(fastq_file, fastq_data)
 
                 config["fastq_file"] = fastq_file
@@ -94,12 +186,11 @@ def _mothur_trim_files(config, data_dir = None, **kwargs):
             build_mothur_script(
                 template = "mothur/trim",
                 output   = mothur_file,
-                inputdir = tmp_dir, prefix = prefix, processors = jobs,
+                inputdir = tmp_dir, prefix = prefix, processors = processors,
                 qaverage = settings.get("quality_average"),
                 maxambig = settings.get("maximum_ambiguity"),
                 maxhomop = settings.get("maximum_homopolymers"),
                 pdiffs   = settings.get("primer_difference"),
-                proccessors = jobs,
                 **config
             )
 
@@ -127,20 +218,11 @@ def _mothur_trim_files(config, data_dir = None, **kwargs):
 
                         makedirs(target_dir, exist_ok = True)
                 
-                        copy(
-                            osp.join(tmp_dir, "%s%s" % (prefix, choice[0])),
-                            dest = target_path["fasta"]
-                        )
-
-                        copy(
-                            osp.join(tmp_dir, "%s%s" % (prefix, choice[1])),
-                            dest = target_path["group"]
-                        )
-
-                        copy(
-                            osp.join(tmp_dir, "%s%s" % (prefix, choice[2])),
-                            dest = target_path["summary"]
-                        )
+                        for suffix, target_type in zip(choice, _TARGET_TYPES):
+                            _fast_copy(
+                                osp.join(tmp_dir, "%s%s" % (prefix, suffix)),
+                                target_path[target_type]
+                            )
 
                         logger.info("[group %s] Successfully copied filtered files at %s." % (group, target_dir))
                 
@@ -161,12 +243,13 @@ def trim_seqs(data_dir = None, data = [], *args, **kwargs):
     if not data:
         data = data_input
 
-    jobs = kwargs.get("jobs", settings.get("jobs"))
+    jobs = kwargs.get("jobs", JOBS)
 
     trimmed_dir = makedirs(osp.join(data_dir, _DATA_DIR_NAME_TRIMMED), exist_ok = True)
     logger.info("Storing trimmed FASTQ files at %s." % trimmed_dir)
 
     mothur_configs = []
+    fastq_sizes    = {}
     
     for group, values in iteritems(data):
         for i, _ in enumerate(values):
@@ -175,34 +258,49 @@ def trim_seqs(data_dir = None, data = [], *args, **kwargs):
 
     study_group = data
 
+    # index rows once by (group, layout, trimmed) rather than re-filtering
+    # each group for every (layout, trimmed) combination.
+    study_index = collections.defaultdict(list)
+
+    for group, values in iteritems(study_group):
+        for value in values:
+            study_index[(group, value["layout"], value["trimmed"])].append(value)
+
     logger.info("Found %s groups." % len(study_group))
     logger.info("Building configs for mothur...")
 
     for layout, trim_type in itertools.product(("paired", "single"), ("true", "false")):
         for group, data in iteritems(study_group):
             if len(data):
-                filtered = lfilter(lambda x: x["layout"] == layout and x["trimmed"] == trim_type, data)
+                filtered = study_index.get((group, layout, trim_type), [])
                 files    = []
+
+                tar_dir  = osp.join(trimmed_dir, group, layout,
+                    "trimmed" if trim_type == "true" else "untrimmed")
+
+                if filtered and _check_target_path(tar_dir):
+                    logger.warn("[group %s] Filtered files already exists." % group)
+                    continue
                 
                 for d in filtered:
                     sra_id  = d["sra"]
                     sra_dir = osp.join(data_dir, sra_id)
 
                     # fasta_files = get_files(sra_dir, "*.fastq")
-                    fasta_files = os.listdir(sra_dir)
-                    fasta_files = [osp.join(sra_dir, fasta_file) for fasta_file in fasta_files
-                        if fasta_file.endswith(".fastq")]
+                    fasta_files = [entry for entry in os.scandir(sra_dir)
+                        if entry.name.endswith(".fastq")]
 
-                    files += fasta_files
+                    for entry in fasta_files:
+                        # DirEntry caches stat(), reuse it to size configs below.
+                        fastq_sizes[entry.path] = entry.stat().st_size
+
+                    files += [entry.path for entry in fasta_files]
 
                 if files:
                     logger.info("Filtering FASTQ files for group %s of type (layout: %s, trimmed: %s)" % (group, layout, trim_type))
 
                     sample  = data[0]
 
-                    tar_dir = osp.join(trimmed_dir, group, layout,
-                        "trimmed" if trim_type == "true" else "untrimmed")
-
                     mothur_configs.append({
                         "files": files,
                         "target_dir": tar_dir,
@@ -226,12 +324,22 @@ def trim_seqs(data_dir = None, data = [], *args, **kwargs):
     if mothur_configs:
         logger.info("Filtering files using mothur using %s jobs...." % jobs)
 
-        trim_chunks = settings.get("trim_chunks")
+        # mothur runtime scales with input size, submit the largest first
+        # so that big configs don't straggle at the tail.
+        mothur_configs.sort(key = lambda x: sum(fastq_sizes[f] for f in x["files"]),
+            reverse = True)
+
+        length    = len(mothur_configs)
+        in_flight = min(jobs, length)
+
+        # keep the total number of mothur threads across workers close to jobs.
+        processors = max(1, jobs // in_flight)
 
-        for chunk in chunkify(mothur_configs, trim_chunks):
-            with parallel.no_daemon_pool(processes = jobs) as pool:
-                length    = len(mothur_configs)
-                function_ = build_fn(_mothur_trim_files, *args, **kwargs)
-                results   = pool.imap(function_, chunk)
+        with ProcessPoolExecutor(max_workers = in_flight) as pool:
+            function_ = build_fn(_mothur_trim_files, processors = processors, *args, **kwargs)
+            futures   = [pool.submit(function_, config) for config in mothur_configs]
 
-                list(tq.tqdm(results, total = length))
\ No newline at end of file
+            # drain in completion order, bpyutils' imap_unordered yields in
+            # submission order and would stall progress behind the largest.
+            for future in tq.tqdm(as_completed(futures), total = length):
+                future.result()
\ No newline at end of file
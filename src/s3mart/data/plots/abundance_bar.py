@@ -1,10 +1,8 @@
-from rpy2.robjects.packages import importr
-
-from s3mart.data.plots.util import save_plot, rarefy_pseq
+from s3mart.data.plots.util import save_plot, rarefy_pseq, get_pseq
 from s3mart import settings
 
 def plot(*args, **kwargs):
-    pseq = importr("phyloseq")
+    pseq = get_pseq()
     mothur_data = kwargs["mothur_data"]
     
     pseq_data   = pseq.import_mothur(
@@ -1,12 +1,10 @@
-from rpy2.robjects.packages import importr
-
-from s3mart.data.plots.util import save_plot, rarefy_pseq
+from s3mart.data.plots.util import save_plot, rarefy_pseq, get_pseq
 from s3mart import settings
 
 def plot(*args, **kwargs):
     mothur_data = kwargs["mothur_data"]
 
-    pseq = importr("phyloseq")
+    pseq = get_pseq()
     
     pseq_data   = pseq.import_mothur(
         mothur_shared_file  = mothur_data["shared"],
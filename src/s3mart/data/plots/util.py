@@ -1,4 +1,5 @@
 import os.path as osp
+import threading
 
 from rpy2.robjects.packages import importr
 import rpy2.robjects as ro
@@ -7,6 +8,22 @@ from s3mart import settings
 
 R = ro.r
 
+_PSEQ      = None
+_PSEQ_LOCK = threading.Lock()
+
+def get_pseq():
+    """
+    Get the phyloseq R package, imported once on first use.
+    """
+    global _PSEQ
+
+    if _PSEQ is None:
+        with _PSEQ_LOCK:
+            if _PSEQ is None:
+                _PSEQ = importr("phyloseq")
+
+    return _PSEQ
+
 def save_plot(plot, *args, **kwargs):
     target_file = kwargs.pop("target_file")
     suffix      = kwargs.get("suffix", None)
@@ -29,7 +46,7 @@ def save_plot(plot, *args, **kwargs):
     htmlwidgets.saveWidget(plot, file = target_file, libdir = "libs")
 
 def rarefy_pseq(pseq_data):
-    phyloseq  = importr("phyloseq")
+    phyloseq  = get_pseq()
     resampled = phyloseq.rarefy_even_depth(pseq_data, rngseed = settings.get("seed"))
 
     return resampled
\ No newline at end of file
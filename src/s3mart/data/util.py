@@ -1,8 +1,10 @@
 import os.path as osp
+import functools
 
 from jinja2 import Template
 
 from bpyutils import log
+from bpyutils.util.ml      import get_data_dir
 from bpyutils.util.system  import read, extract_all, write
 from bpyutils.util.request import download_file
 
@@ -12,11 +14,22 @@ from s3mart import __name__ as NAME, settings
 
 logger = log.get_logger(name = NAME)
 
+@functools.lru_cache(maxsize = 8)
+def resolve_data_dir(name, data_dir = None):
+    """
+    Resolve (and create) the data directory once per set of arguments.
+    """
+    return get_data_dir(name, data_dir)
+
+@functools.lru_cache(maxsize = 32)
+def _compile_template(template_path):
+    return Template(read(template_path))
+
 def render_template(*args, **kwargs):
     script = kwargs["template"]
 
     template_path = osp.join(PATH["DATA"], "templates", script)
-    template = Template(read(template_path))
+    template = _compile_template(template_path)
     
     rendered = template.render(*args, **kwargs)
 
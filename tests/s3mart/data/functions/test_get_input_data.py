@@ -0,0 +1,38 @@
+# imports - standard imports
+import os.path as osp
+
+# imports - module imports
+from s3mart.data.functions.get_input_data import _read_csv_rows
+from bpyutils.util._csv import read
+
+import s3mart
+
+def test_read_csv_rows(tmpdir):
+    path = osp.join(osp.dirname(s3mart.__file__), "data", "sample.csv")
+    assert list(_read_csv_rows(path)) == read(path)
+
+    # a column typed from its first value may still hold cells of other types.
+    path = str(tmpdir.join("mixed.csv"))
+
+    with open(path, "w") as f:
+        f.write("\n".join([
+            "group,sra,value,ratio,flag",
+            "A,SRR1,x,2.5,True",
+            "2,SRR2,5,3,1",
+            ",SRR3,,inf,None",
+            "B,SRR4,1.5,,False"
+        ]))
+
+    assert list(_read_csv_rows(path)) == read(path)
+
+    # rows shorter or longer than the header.
+    path = str(tmpdir.join("ragged.csv"))
+
+    with open(path, "w") as f:
+        f.write("\n".join([
+            "group,sra,layout,trimmed",
+            "A,SRR1,paired",
+            "B,SRR2,single,True,1,extra"
+        ]))
+
+    assert list(_read_csv_rows(path)) == read(path)
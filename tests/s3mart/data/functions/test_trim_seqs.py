@@ -0,0 +1,56 @@
+# imports - standard imports
+import os, os.path as osp
+
+# imports - module imports
+from s3mart.data.functions.trim_seqs import _stage_files, _fast_copy
+
+def _make_file(path, size):
+    with open(path, "wb") as f:
+        f.write(b"A" * size)
+
+    return str(path)
+
+def test_stage_files(tmpdir):
+    source = _make_file(tmpdir.join("a.fastq"), 15000)
+    dest   = str(tmpdir.mkdir("dest"))
+
+    # duplicate inputs (e.g. a duplicate SRA row) are staged once.
+    _stage_files([source, source], dest)
+
+    assert osp.getsize(source) == 15000
+    assert os.listdir(dest)    == ["a.fastq"]
+    assert osp.getsize(osp.join(dest, "a.fastq")) == 15000
+
+    # colliding basenames never overwrite the already staged file.
+    other = tmpdir.mkdir("other")
+    collision = _make_file(other.join("a.fastq"), 10)
+
+    _stage_files([collision], dest)
+
+    assert osp.getsize(source)    == 15000
+    assert osp.getsize(collision) == 10
+    assert osp.getsize(osp.join(dest, "a.fastq")) == 15000
+
+def test_fast_copy(tmpdir, monkeypatch):
+    source = _make_file(tmpdir.join("a.fastq"), 15000)
+    target = str(tmpdir.join("b.fastq"))
+
+    _fast_copy(source, target)
+
+    assert osp.getsize(target) == 15000
+
+    # a copy_file_range that stops early (returns 0) must not truncate.
+    if hasattr(os, "copy_file_range"):
+        copy_file_range = os.copy_file_range
+        calls = []
+
+        def short_copy_file_range(src, dst, count, *args, **kwargs):
+            calls.append(count)
+            return copy_file_range(src, dst, 1000) if len(calls) == 1 else 0
+
+        monkeypatch.setattr(os, "copy_file_range", short_copy_file_range)
+
+        target = str(tmpdir.join("c.fastq"))
+        _fast_copy(source, target)
+
+        assert osp.getsize(target) == 15000